@@ -1,8 +1,19 @@
 import random
 import time
+import sys
+import io
+import contextlib
+import os
+import select
+import selectors
+from dataclasses import dataclass
 import threading
 import queue
 import math
+from collections import deque
+from bisect import bisect_right, insort
+from itertools import accumulate
+from operator import attrgetter, itemgetter
 
 # --- Configuration Panel (Defaults) ---
 CONFIG = {
@@ -30,6 +41,7 @@ CONFIG = {
     "nemesis_targeting_threshold": -5, # How negative relationship needs to be to prioritize target
     "nemesis_trait_threshold": 3, # How many times an event needs to happen for a basic trait
     "simulation_step_delay": 0.3, # Seconds between steps
+    "render_every": 1, # During 'run', show the standings every this many steps (and at the finish)
 }
 
 # Ensure item chances sum roughly to 1 (or adjust logic)
@@ -39,37 +51,73 @@ CONFIG["item_chance_green_shell"] /= _total_chance
 CONFIG["item_chance_red_shell"] /= _total_chance
 CONFIG["item_chance_banana"] /= _total_chance
 
+# Type of each setting, used to convert values typed into the 'config' command
+CONFIG_TYPES = {key: type(value) for key, value in CONFIG.items()}
+
+
+_position_key = attrgetter("position")
+_obstacle_position_key = itemgetter("position")
+
 
 # --- Item Definitions ---
+# Items are small ints so per-item counters can be plain lists indexed by item id
 class Item:
-    BOOST = "Boost"
-    GREEN_SHELL = "Green Shell"
-    RED_SHELL = "Red Shell"
-    BANANA = "Banana"
+    NONE = 0 # Empty hand / not hit by anything
+    BOOST = 1
+    GREEN_SHELL = 2
+    RED_SHELL = 3
+    BANANA = 4
+
+ITEM_NAMES = ("None", "Boost", "Green Shell", "Red Shell", "Banana") # Indexed by item id
+_ITEM_NORM = tuple("_".join(name.lower().split()) for name in ITEM_NAMES) # 'Green Shell' -> 'green_shell'
+
+# Item box draw order; Game.item_cdf holds the cumulative chance thresholds in the same order
+_ITEMS = (Item.BOOST, Item.GREEN_SHELL, Item.RED_SHELL, Item.BANANA)
+
+_HIT_ITEMS = (Item.GREEN_SHELL, Item.RED_SHELL, Item.BANANA) # Items that can hit a racer
+_TARGETED_ITEMS = (Item.GREEN_SHELL, Item.RED_SHELL) # Items fired at a named racer
+
+# CONFIG keys for the speed penalty / stun duration of each item that can hit a racer, indexed by item id
+_HIT_PENALTY_KEY = (None, None, "shell_hit_speed_penalty", "shell_hit_speed_penalty", "banana_hit_speed_penalty")
+_HIT_DURATION_KEY = (None, None, "shell_hit_duration", "shell_hit_duration", "banana_hit_duration")
 
 # --- Nemesis Traits ---
 class Trait:
-    AGGRESSIVE = "Aggressive" # More likely to use offensive items quickly
-    SHELL_SHOCKED = "Shell-Shocked" # Briefly slower after *any* hit
-    TARGET_FIXATED = "Target Fixated" # Over-prioritizes nemesis target
-    SLIPPERY = "Slippery" # Slightly higher chance to dodge bananas? (Maybe too complex for V1)
+    AGGRESSIVE = 0 # More likely to use offensive items quickly
+    SHELL_SHOCKED = 1 # Briefly slower after *any* hit
+    TARGET_FIXATED = 2 # Over-prioritizes nemesis target
+    SLIPPERY = 3 # Slightly higher chance to dodge bananas? (Maybe too complex for V1)
+
+TRAIT_NAMES = ("Aggressive", "Shell-Shocked", "Target Fixated", "Slippery") # Indexed by trait id
+
+def format_traits(traits):
+    return ", ".join(TRAIT_NAMES[t] for t in sorted(traits)) if traits else "None"
 
 # --- Racer Class ---
 class Racer:
+    # Fixed attribute layout: racers are touched every step, so skip the per-instance __dict__
+    __slots__ = (
+        "name", "is_player", "position", "speed", "base_speed", "current_item",
+        "item_uses", "times_hit_by", "boost_timer", "hit_timer", "last_hit_by",
+        "last_hit_by_item", "relationships", "traits", "hit_by_count",
+        "hit_others_count", "next_item_box_pos",
+    )
+
     def __init__(self, name, is_player=False):
         self.name = name
         self.is_player = is_player
         self.position = 0.0
         self.speed = random.uniform(CONFIG["base_speed_min"], CONFIG["base_speed_max"])
         self.base_speed = self.speed
-        self.current_item = None
-        self.item_uses = {Item.BOOST: 0, Item.GREEN_SHELL: 0, Item.RED_SHELL: 0, Item.BANANA: 0}
-        self.times_hit_by = {Item.GREEN_SHELL: 0, Item.RED_SHELL: 0, Item.BANANA: 0}
+        self.current_item = Item.NONE
+        self.item_uses = [0] * len(ITEM_NAMES) # Indexed by item id
+        self.times_hit_by = [0] * len(ITEM_NAMES)
 
         # Status Effects
         self.boost_timer = 0
         self.hit_timer = 0
         self.last_hit_by = None # Racer who last hit this one
+        self.last_hit_by_item = Item.NONE
 
         # Nemesis Data
         self.relationships = {} # Key: Racer Name, Value: Relationship Score (-10 to +10)
@@ -82,10 +130,11 @@ class Racer:
 
     def initialize_relationships(self, all_racers):
         for r in all_racers:
+            # Hit counters cover every racer, self included (own bananas), so hits can just += 1
+            self.hit_by_count[r.name] = 0
+            self.hit_others_count[r.name] = 0
             if r.name != self.name:
                 self.relationships[r.name] = 0
-                self.hit_by_count[r.name] = 0
-                self.hit_others_count[r.name] = 0
 
     def update_relationship(self, other_racer_name, change):
         if other_racer_name in self.relationships:
@@ -95,7 +144,7 @@ class Racer:
     def add_trait(self, trait):
         if trait not in self.traits:
             self.traits.add(trait)
-            debug_log(f"Nemesis: {self.name} gained trait: {trait}")
+            debug_log("Nemesis: %s gained trait: %s", self.name, TRAIT_NAMES[trait])
 
     def check_trait_conditions(self):
          # Aggressive: Used many offensive items
@@ -109,7 +158,7 @@ class Racer:
              self.add_trait(Trait.SHELL_SHOCKED)
 
         # Target Fixated: Strong negative relationship exists
-        has_strong_negative = any(rel <= CONFIG["nemesis_targeting_threshold"] for rel in self.relationships.values())
+        has_strong_negative = bool(self.relationships) and min(self.relationships.values()) <= CONFIG["nemesis_targeting_threshold"]
         if has_strong_negative and Trait.TARGET_FIXATED not in self.traits:
              self.add_trait(Trait.TARGET_FIXATED)
         elif not has_strong_negative and Trait.TARGET_FIXATED in self.traits:
@@ -126,97 +175,92 @@ class Racer:
             return "drive", None # No item, just drive
 
         # Basic Nemesis Targeting
-        potential_targets = []
-        my_pos_index = game_state['positions'].index((self.name, self.position))
+        my_rank = game_state['name_to_rank'][self.name]
+        sorted_racers = game_state['sorted_racers'] # Leader first
 
         # Find racers ahead or behind based on item
-        racers_ahead = [r for r_name, r_pos in game_state['positions'][my_pos_index+1:] if r_pos > self.position]
-        racers_behind = [r for r_name, r_pos in game_state['positions'][:my_pos_index] if r_pos < self.position]
-        
-        target = None
+        racers_ahead = [r for r in sorted_racers[:my_rank] if r.position > self.position]
+        racers_behind = [r for r in sorted_racers[my_rank+1:] if r.position < self.position]
+
         nemesis_target = None
 
         # Check for strong negative relationship (Nemesis target)
-        strong_negative_targets = {name: r for name, r in game_state['racers'].items() if self.relationships.get(name, 0) <= CONFIG["nemesis_targeting_threshold"]}
-
-        if strong_negative_targets:
-             # Simplistic: pick the 'most hated' one that's in range if possible
-             most_hated_name = min(strong_negative_targets, key=lambda name: self.relationships[name])
-             nemesis_target = game_state['racers'][most_hated_name]
-
-
-        # Item specific logic
-        if self.current_item == Item.BOOST:
-            # Use boost if not already boosting and maybe save for a straight? (simple: use immediately)
-            if self.boost_timer <= 0:
-                return "use_item", None
-        elif self.current_item == Item.GREEN_SHELL:
-             # Use if someone is roughly directly ahead or behind (simple: fire forward if anyone ahead)
-             # Nemesis: Prioritize hitting nemesis if ahead?
-             if nemesis_target and nemesis_target in racers_ahead:
-                 target = nemesis_target # Maybe add accuracy check later
-                 debug_log(f"AI {self.name}: Targeting Nemesis {target.name} with Green Shell")
-             elif racers_ahead:
-                 target = random.choice(racers_ahead) # Simple targetting
-             if target:
-                return "use_item", target.name # Target name
-        elif self.current_item == Item.RED_SHELL:
-            # Use if someone is ahead. Prioritize Nemesis.
-             if nemesis_target and nemesis_target in racers_ahead:
-                 target = nemesis_target
-                 debug_log(f"AI {self.name}: Targeting Nemesis {target.name} with Red Shell")
-             elif racers_ahead:
-                 # Find closest racer ahead
-                 target = min(racers_ahead, key=lambda r: r.position)
-             if target:
-                return "use_item", target.name
-        elif self.current_item == Item.BANANA:
-            # Drop if someone is close behind, or maybe just randomly?
-            # Nemesis: Drop if nemesis is close behind?
-            racers_close_behind = [r for r in racers_behind if self.position - r.position < 50] # Example range
-            if nemesis_target and nemesis_target in racers_close_behind:
-                 debug_log(f"AI {self.name}: Dropping Banana defensively against Nemesis {nemesis_target.name}")
-                 return "use_item", None # Drop behind self
-            elif racers_close_behind and random.random() < 0.7: # High chance if someone close behind
-                 return "use_item", None
-            elif Trait.AGGRESSIVE in self.traits and random.random() < 0.3: # Aggressive AI might drop randomly
-                 return "use_item", None
+        # Simplistic: the 'most hated' racer, found in one pass, is the nemesis if hated enough
+        if self.relationships:
+             most_hated_name = min(self.relationships, key=self.relationships.__getitem__)
+             if self.relationships[most_hated_name] <= CONFIG["nemesis_targeting_threshold"]:
+                 nemesis_target = game_state['racers'][most_hated_name]
+
+        # Item specific logic, dispatched on the held item's id
+        return _ITEM_DECIDERS[self.current_item](self, racers_ahead, racers_behind, nemesis_target)
+
+    def _decide_boost(self, racers_ahead, racers_behind, nemesis_target):
+        # Use boost if not already boosting and maybe save for a straight? (simple: use immediately)
+        if self.boost_timer <= 0:
+            return "use_item", None
+        return "drive", None
 
+    def _decide_green_shell(self, racers_ahead, racers_behind, nemesis_target):
+        # Use if someone is roughly directly ahead or behind (simple: fire forward if anyone ahead)
+        # Nemesis: Prioritize hitting nemesis if ahead?
+        if nemesis_target and nemesis_target in racers_ahead:
+            debug_log("AI %s: Targeting Nemesis %s with Green Shell", self.name, nemesis_target.name)
+            return "use_item", nemesis_target.name # Maybe add accuracy check later
+        if racers_ahead:
+            return "use_item", random.choice(racers_ahead).name # Simple targetting
+        return "drive", None
 
+    def _decide_red_shell(self, racers_ahead, racers_behind, nemesis_target):
+        # Use if someone is ahead. Prioritize Nemesis.
+        if nemesis_target and nemesis_target in racers_ahead:
+            debug_log("AI %s: Targeting Nemesis %s with Red Shell", self.name, nemesis_target.name)
+            return "use_item", nemesis_target.name
+        if racers_ahead:
+            # Closest racer ahead; racers_ahead is leader first, so it's the last one
+            return "use_item", racers_ahead[-1].name
+        return "drive", None
+
+    def _decide_banana(self, racers_ahead, racers_behind, nemesis_target):
+        # Drop if someone is close behind, or maybe just randomly?
+        # Nemesis: Drop if nemesis is close behind?
+        racers_close_behind = [r for r in racers_behind if self.position - r.position < 50] # Example range
+        if nemesis_target and nemesis_target in racers_close_behind:
+             debug_log("AI %s: Dropping Banana defensively against Nemesis %s", self.name, nemesis_target.name)
+             return "use_item", None # Drop behind self
+        elif racers_close_behind and random.random() < 0.7: # High chance if someone close behind
+             return "use_item", None
+        elif Trait.AGGRESSIVE in self.traits and random.random() < 0.3: # Aggressive AI might drop randomly
+             return "use_item", None
         # Default: Keep driving if no good use case found yet
         return "drive", None
 
 
     def update_step(self, game_state):
         # Handle status effects first
+        config = CONFIG
         current_speed = self.base_speed
-        if self.hit_timer > 0:
-            self.hit_timer -= 1
-            # Apply speed penalty based on what hit us
-            penalty = 0
-            duration = 0
-            if self.last_hit_by_item == Item.GREEN_SHELL or self.last_hit_by_item == Item.RED_SHELL:
-                penalty = CONFIG["shell_hit_speed_penalty"]
-                #duration = CONFIG["shell_hit_duration"] # Duration handled by timer
-            elif self.last_hit_by_item == Item.BANANA:
-                 penalty = CONFIG["banana_hit_speed_penalty"]
-                 #duration = CONFIG["banana_hit_duration"]
+        hit_timer = self.hit_timer
+        if hit_timer > 0:
+            hit_timer -= 1
+            self.hit_timer = hit_timer
+            # Apply speed penalty based on what hit us (duration handled by timer)
+            penalty = config[_HIT_PENALTY_KEY[self.last_hit_by_item]]
 
             # Trait modification: Shell-Shocked
             if Trait.SHELL_SHOCKED in self.traits:
                  penalty *= 1.5 # Slower for longer or more impact? Simple: More impact.
 
             current_speed += penalty
-            if self.hit_timer == 0:
-                debug_log(f"{self.name} recovered from hit.")
+            if hit_timer == 0:
+                debug_log("%s recovered from hit.", self.name)
                 self.last_hit_by = None
-                self.last_hit_by_item = None
+                self.last_hit_by_item = Item.NONE
 
         elif self.boost_timer > 0:
-            current_speed += CONFIG["boost_speed_bonus"]
+            current_speed += config["boost_speed_bonus"]
             self.boost_timer -= 1
             if self.boost_timer == 0:
-                 debug_log(f"{self.name}'s boost ended.")
+                 debug_log("%s's boost ended.", self.name)
 
         # Ensure speed doesn't go below a minimum reasonable value (e.g., 0 or slightly above)
         current_speed = max(1, current_speed) # Can't go backwards unless explicitly designed
@@ -226,38 +270,24 @@ class Racer:
         self.position = new_position
 
         # Check for hitting item boxes
-        if self.position >= self.next_item_box_pos:
+        if new_position >= self.next_item_box_pos:
             if not self.current_item: # Can only pick up if hand is empty
                 self.get_item(game_state)
-            self.next_item_box_pos += CONFIG["item_box_spacing"] # Set next target box
+            self.next_item_box_pos += config["item_box_spacing"] # Set next target box
 
 
     def get_item(self, game_state):
-        # Simple item distribution - maybe add catch-up later
-        boost_chance = CONFIG["item_chance_boost"]
-        shell_chance = CONFIG["item_chance_green_shell"]
-        red_shell_chance = CONFIG["item_chance_red_shell"]
-        banana_chance = CONFIG["item_chance_banana"]
+        # Simple item distribution, thresholds precomputed by Game.refresh_item_tables()
+        item_cdf = game_state['item_cdf']
 
         # Catch-up assist
-        leader_pos = game_state['positions'][-1][1] if game_state['positions'] else self.position
+        leader_pos = game_state['sorted_racers'][0].position
         if leader_pos - self.position > CONFIG["catch_up_assist_threshold"]:
-            debug_log(f"{self.name} is far behind, applying catch-up item bonus.")
-            boost_chance *= CONFIG["catch_up_item_boost_mult"]
-            # Re-normalize probabilities if needed, or just increase boost chance relative to others
-            # Simple approach: just boost the boost chance, let random selection handle it.
-
-
-        rand_val = random.random()
-        if rand_val < boost_chance:
-            self.current_item = Item.BOOST
-        elif rand_val < boost_chance + shell_chance:
-            self.current_item = Item.GREEN_SHELL
-        elif rand_val < boost_chance + shell_chance + red_shell_chance:
-            self.current_item = Item.RED_SHELL
-        else:
-            self.current_item = Item.BANANA
-        debug_log(f"{self.name} got item: {self.current_item}")
+            debug_log("%s is far behind, applying catch-up item bonus.", self.name)
+            item_cdf = game_state['catch_up_item_cdf']
+
+        self.current_item = _ITEMS[bisect_right(item_cdf, random.random())]
+        debug_log("%s got item: %s", self.name, ITEM_NAMES[self.current_item])
 
 
     def use_item(self, target_name, game_state):
@@ -265,15 +295,19 @@ class Racer:
             return False # No item to use
 
         item_used = self.current_item
-        self.current_item = None
+        self.current_item = Item.NONE
         self.item_uses[item_used] += 1
-        debug_log(f"{self.name} used {item_used}" + (f" targeting {target_name}" if target_name else ""))
+        game_state['traits_dirty'].add(self.name)
+        if target_name:
+            debug_log("%s used %s targeting %s", self.name, ITEM_NAMES[item_used], target_name)
+        else:
+            debug_log("%s used %s", self.name, ITEM_NAMES[item_used])
 
 
         # --- Item Effects ---
         if item_used == Item.BOOST:
             self.boost_timer = CONFIG["boost_duration"]
-            debug_log(f"{self.name} started boosting!")
+            debug_log("%s started boosting!", self.name)
 
         elif item_used == Item.GREEN_SHELL:
             # Simple: Hit target if specified and exists. Add inaccuracy later?
@@ -284,7 +318,7 @@ class Racer:
                      "item": item_used
                  })
                  # Update Nemesis hit counts immediately upon USE targeting someone
-                 self.hit_others_count[target_racer.name] = self.hit_others_count.get(target_racer.name, 0) + 1
+                 self.hit_others_count[target_racer.name] += 1
 
         elif item_used == Item.RED_SHELL:
              # Homing: More likely to hit the intended target ahead
@@ -294,44 +328,43 @@ class Racer:
                      "type": "hit", "attacker": self.name, "target": target_racer.name,
                      "item": item_used
                  })
-                 self.hit_others_count[target_racer.name] = self.hit_others_count.get(target_racer.name, 0) + 1
+                 self.hit_others_count[target_racer.name] += 1
              else:
-                 debug_log(f"{self.name}'s Red Shell fizzled (target invalid or behind).")
+                 debug_log("%s's Red Shell fizzled (target invalid or behind).", self.name)
 
 
         elif item_used == Item.BANANA:
              # Place banana behind the racer
              banana_pos = self.position - (self.base_speed / 2) # Place slightly behind
-             game_state['obstacles'].append({"type": Item.BANANA, "position": banana_pos, "owner": self.name})
-             debug_log(f"{self.name} dropped a Banana at position {banana_pos:.1f}")
+             # Obstacles are kept sorted by position so collision checks can bisect
+             insort(game_state['obstacles'], {"type": Item.BANANA, "position": banana_pos, "owner": self.name},
+                    key=_obstacle_position_key)
+             debug_log("%s dropped a Banana at position %.1f", self.name, banana_pos)
 
         return True # Item was used
 
 
     def apply_hit(self, attacker_name, item_type, game_state):
         if self.hit_timer > 0: # Don't get hit if already stunned (grace period)
-             debug_log(f"{self.name} has hit immunity, dodged {item_type}.")
+             debug_log("%s has hit immunity, dodged %s.", self.name, ITEM_NAMES[item_type])
              return
 
-        debug_log(f"{self.name} was hit by {attacker_name}'s {item_type}!")
+        debug_log("%s was hit by %s's %s!", self.name, attacker_name, ITEM_NAMES[item_type])
         self.boost_timer = 0 # Stop boosting if hit
         self.last_hit_by = attacker_name
         self.last_hit_by_item = item_type
         self.times_hit_by[item_type] += 1
         if attacker_name: # Can be hit by own banana or unattributed obstacle
-            self.hit_by_count[attacker_name] = self.hit_by_count.get(attacker_name, 0) + 1
+            self.hit_by_count[attacker_name] += 1
 
         # Set hit duration based on item
-        if item_type == Item.GREEN_SHELL or item_type == Item.RED_SHELL:
-             self.hit_timer = CONFIG["shell_hit_duration"]
-        elif item_type == Item.BANANA:
-             self.hit_timer = CONFIG["banana_hit_duration"]
+        self.hit_timer = CONFIG[_HIT_DURATION_KEY[item_type]]
 
         # --- Nemesis Relationship Update ---
         if attacker_name:
              # The one hit dislikes the attacker
              self.update_relationship(attacker_name, CONFIG["nemesis_hit_relationship_penalty"])
-             debug_log(f"Nemesis: {self.name}'s relationship towards {attacker_name} decreased to {self.relationships.get(attacker_name, 0)}")
+             debug_log("Nemesis: %s's relationship towards %s decreased to %d", self.name, attacker_name, self.relationships.get(attacker_name, 0))
              # Attacker might gain 'satisfaction' or rivalry? Less direct impact for simple model.
              attacker_racer = game_state['racers'].get(attacker_name)
              if attacker_racer:
@@ -339,8 +372,12 @@ class Racer:
                   # attacker_racer.update_relationship(self.name, -1)
                   pass
 
-        # Check if traits should be gained after being hit
-        self.check_trait_conditions()
+        # Traits are re-checked at the end of the step
+        game_state['traits_dirty'].add(self.name)
+
+
+# AI item handlers, indexed by item id (Item.NONE never reaches dispatch)
+_ITEM_DECIDERS = (None, Racer._decide_boost, Racer._decide_green_shell, Racer._decide_red_shell, Racer._decide_banana)
 
 
 # --- Game Simulation Class ---
@@ -353,9 +390,11 @@ class Game:
         self.step_count = 0
         self.game_over = False
         self.last_positions = {} # For overtake checks
+        self.standings = [] # Racers sorted by position (leader first), refreshed once per step
+        self.traits_dirty = set() # Names of racers whose trait conditions may have changed this step
 
         # Game world state
-        self.obstacles = [] # List of {"type": Item.BANANA, "position": float, "owner": str}
+        self.obstacles = [] # List of {"type": Item.BANANA, "position": float, "owner": str}, sorted by position
 
         # Setup Racers
         racer_names = [f"CPU_{i+1}" for i in range(config["num_racers"] - 1)]
@@ -371,18 +410,50 @@ class Game:
         for name in racer_names:
             self.racers[name] = Racer(name)
 
+        self.racer_names = frozenset(self.racers) # Rebuild if racers are ever added/removed
         all_racer_list = list(self.racers.values())
         for r in self.racers.values():
             r.initialize_relationships(all_racer_list)
-
-    def get_state(self):
+        self.standings = self.sort_racers()
+        self.refresh_item_tables()
+
+    def refresh_item_tables(self):
+        """Rebuilds the cumulative item chance thresholds; call again after changing item chances."""
+        chances = [
+            self.config["item_chance_boost"],
+            self.config["item_chance_green_shell"],
+            self.config["item_chance_red_shell"],
+            self.config["item_chance_banana"],
+        ]
+        item_cdf = self._build_item_cdf(chances)
+        # Catch-up: scale the boost chance, then renormalise so the other items give way
+        chances[0] *= self.config["catch_up_item_boost_mult"]
+        # Both tables are built before either is replaced, so a bad setting leaves the old ones in place
+        self.item_cdf, self.catch_up_item_cdf = item_cdf, self._build_item_cdf(chances)
+
+    @staticmethod
+    def _build_item_cdf(chances):
+        # Normalised running totals in _ITEMS order; anything past the last threshold is a Banana
+        total = sum(chances)
+        if total <= 0:
+            raise ValueError("item chances must add up to more than 0")
+        return tuple(running / total for running in accumulate(chances[:-1]))
+
+    def sort_racers(self):
+        return sorted(self.racers.values(), key=_position_key, reverse=True)
+
+    def get_state(self, sorted_racers=None):
          # Provides necessary info for AI decisions and event processing
-         sorted_racers = sorted(self.racers.values(), key=lambda r: r.position, reverse=True)
-         positions = [(r.name, r.position) for r in sorted_racers]
+         if sorted_racers is None:
+             sorted_racers = self.sort_racers()
          return {
              "racers": self.racers,
-             "positions": positions, # List of (name, pos) tuples, sorted
+             "sorted_racers": sorted_racers, # Racer objects, leader first
+             "name_to_rank": {r.name: i for i, r in enumerate(sorted_racers)},
              "obstacles": self.obstacles,
+             "traits_dirty": self.traits_dirty,
+             "item_cdf": self.item_cdf,
+             "catch_up_item_cdf": self.catch_up_item_cdf,
              "pending_events": [], # Events generated this step (hits, etc.)
              "track_length": self.config["track_length"],
              "step": self.step_count,
@@ -393,9 +464,11 @@ class Game:
             return True
 
         self.step_count += 1
-        debug_log(f"\n--- Step {self.step_count} ---")
+        debug_log("\n--- Step %d ---", self.step_count)
 
-        current_game_state = self.get_state()
+        # Positions only change in step 2, so one sort before and one after covers the whole step
+        last_sorted_racers = self.standings
+        current_game_state = self.get_state(last_sorted_racers)
         actions = {} # racer_name: (action_type, target_name)
 
         # 1. Decide Actions (AI + Player)
@@ -405,6 +478,8 @@ class Game:
                     actions[name] = (player_action, player_target)
                 else:
                     actions[name] = ("drive", None) # Default if no input
+            elif not racer.current_item:
+                actions[name] = ("drive", None) # Empty-handed AI has nothing to decide
             else:
                 # Store AI decisions
                 actions[name] = racer.decide_action(current_game_state)
@@ -432,95 +507,108 @@ class Game:
                     target_racer.apply_hit(event['attacker'], event['item'], current_game_state)
 
         # 4. Check Obstacle Collisions (Bananas)
-        new_obstacles = []
-        racers_to_check = list(self.racers.values()) # Check against current positions
-        for obs in self.obstacles:
-            hit_obstacle = False
-            for racer in racers_to_check:
-                 # Check if racer moved over the obstacle in this step
-                 last_pos = self.last_positions.get(racer.name, racer.position)
-                 current_pos = racer.position
-                 # Simple check: did the interval [last_pos, current_pos] cross obs['position']?
-                 if min(last_pos, current_pos) < obs['position'] <= max(last_pos, current_pos):
-                     if racer.hit_timer <= 0: # Can't hit if already stunned
-                         debug_log(f"Collision: {racer.name} hit {obs['owner']}'s {obs['type']} at {obs['position']:.1f}")
-                         racer.apply_hit(obs['owner'], obs['type'], current_game_state)
-                         hit_obstacle = True
-                         # Optional: remove racer from further checks this step if needed
-                         # racers_to_check.remove(racer)
-                         break # Obstacle is used up
-            if not hit_obstacle:
-                 new_obstacles.append(obs) # Keep obstacle if not hit
-        self.obstacles = new_obstacles
+        if self.obstacles:
+            # Swept interval (lo, hi] of every racer this step, computed once rather than per obstacle
+            sweeps = []
+            for racer in self.racers.values():
+                last_pos = self.last_positions.get(racer.name, racer.position)
+                current_pos = racer.position
+                if last_pos <= current_pos:
+                    sweeps.append((racer, last_pos, current_pos))
+                else:
+                    sweeps.append((racer, current_pos, last_pos))
+
+            # Only obstacles inside the span swept by the whole field can be hit
+            obstacles = self.obstacles
+            lo_idx = bisect_right(obstacles, min(sweep[1] for sweep in sweeps), key=_obstacle_position_key)
+            hi_idx = bisect_right(obstacles, max(sweep[2] for sweep in sweeps), key=_obstacle_position_key)
+
+            if lo_idx < hi_idx:
+                new_obstacles = obstacles[:lo_idx]
+                for obs in obstacles[lo_idx:hi_idx]:
+                    obs_pos = obs['position']
+                    hit_obstacle = False
+                    for racer, lo, hi in sweeps:
+                         # Did the interval [last_pos, current_pos] cross obs['position']?
+                         if lo < obs_pos <= hi and racer.hit_timer <= 0: # Can't hit if already stunned
+                             debug_log("Collision: %s hit %s's %s at %.1f", racer.name, obs['owner'], ITEM_NAMES[obs['type']], obs_pos)
+                             racer.apply_hit(obs['owner'], obs['type'], current_game_state)
+                             hit_obstacle = True
+                             break # Obstacle is used up
+                    if not hit_obstacle:
+                         new_obstacles.append(obs) # Keep obstacle if not hit
+                new_obstacles.extend(obstacles[hi_idx:])
+                self.obstacles = new_obstacles
 
 
         # 5. Check for Overtakes (Nemesis Update)
-        current_sorted_racers = sorted(self.racers.values(), key=lambda r: r.position, reverse=True)
-        last_sorted_racers_names = [r[0] for r in sorted(self.last_positions.items(), key=lambda item: item[1], reverse=True)]
+        current_sorted_racers = self.sort_racers()
+        self.standings = current_sorted_racers
+        last_rank = {r.name: i for i, r in enumerate(last_sorted_racers)}
+        current_rank = {r.name: i for i, r in enumerate(current_sorted_racers)}
+        overtake_penalty = CONFIG["nemesis_overtake_relationship_penalty"]
 
         for i, current_racer in enumerate(current_sorted_racers):
-             try:
-                 last_rank_index = last_sorted_racers_names.index(current_racer.name)
-                 if i < last_rank_index: # Racer improved rank
-                     # Check who they overtook
-                     for j in range(i + 1, last_rank_index + 1):
-                          # Potential bug here if list lengths change, be careful
-                          if j < len(last_sorted_racers_names):
-                            overtaken_racer_name = last_sorted_racers_names[j]
-                            overtaken_racer = self.racers.get(overtaken_racer_name)
-                            if overtaken_racer:
-                                debug_log(f"Overtake: {current_racer.name} overtook {overtaken_racer_name}")
-                                # The one overtaken feels negative towards the overtaker
-                                overtaken_racer.update_relationship(current_racer.name, CONFIG["nemesis_overtake_relationship_penalty"])
-                                debug_log(f"Nemesis: {overtaken_racer_name}'s relationship towards {current_racer.name} decreased to {overtaken_racer.relationships.get(current_racer.name, 0)}")
-             except ValueError:
-                  pass # Racer wasn't in the list last time? Should not happen in normal race.
-
-
-        # 6. Check Win Condition
-        for name, racer in self.racers.items():
-            if racer.position >= self.config["track_length"]:
-                self.winner = name
-                self.game_over = True
-                debug_log(f"\n!!! {name} wins the race! !!!")
-                # Final Nemesis Update based on finishing order
-                winner_racer = self.racers[self.winner]
-                sorted_racers = sorted(self.racers.values(), key=lambda r: r.position, reverse=True)
-                for i, r in enumerate(sorted_racers):
-                    if r.name != self.winner:
-                         # Losers feel negative towards winner & those ahead
-                         for j in range(i):
-                             finisher_ahead = sorted_racers[j]
-                             r.update_relationship(finisher_ahead.name, CONFIG["nemesis_finish_ahead_penalty"])
-                             debug_log(f"Nemesis (Finish): {r.name}'s relationship towards {finisher_ahead.name} decreased to {r.relationships.get(finisher_ahead.name, 0)}")
-                break # End step once winner found
-
-        # 7. Update Traits based on accumulated stats (do this periodically or at end?)
-        # Doing it here each step is simple for now
-        for racer in self.racers.values():
-             racer.check_trait_conditions()
+             last_rank_index = last_rank.get(current_racer.name, i) # Unknown last time? Should not happen in normal race.
+             # Anyone it was behind last step and is ahead of now was overtaken; this includes passes by a
+             # racer whose own rank didn't improve because someone else passed it in the same step
+             for overtaken_racer in last_sorted_racers[:last_rank_index]:
+                  if current_rank[overtaken_racer.name] > i: # Now behind it
+                      debug_log("Overtake: %s overtook %s", current_racer.name, overtaken_racer.name)
+                      # The one overtaken feels negative towards the overtaker
+                      overtaken_racer.update_relationship(current_racer.name, overtake_penalty)
+                      self.traits_dirty.add(overtaken_racer.name)
+                      debug_log("Nemesis: %s's relationship towards %s decreased to %d", overtaken_racer.name, current_racer.name, overtaken_racer.relationships.get(current_racer.name, 0))
+
+
+        # 6. Check Win Condition (the leader is the only racer that can have crossed first)
+        leader = current_sorted_racers[0] if current_sorted_racers else None
+        if leader and leader.position >= self.config["track_length"]:
+            self.winner = leader.name
+            self.game_over = True
+            debug_log("\n!!! %s wins the race! !!!", leader.name)
+            # Final Nemesis Update based on finishing order (the winner is current_sorted_racers[0])
+            finish_penalty = CONFIG["nemesis_finish_ahead_penalty"]
+            for i in range(1, len(current_sorted_racers)):
+                r = current_sorted_racers[i]
+                self.traits_dirty.add(r.name)
+                # Losers feel negative towards winner & those ahead
+                for finisher_ahead in current_sorted_racers[:i]:
+                     r.update_relationship(finisher_ahead.name, finish_penalty)
+                     debug_log("Nemesis (Finish): %s's relationship towards %s decreased to %d", r.name, finisher_ahead.name, r.relationships.get(finisher_ahead.name, 0))
+
+        # 7. Update Traits based on accumulated stats
+        # Only racers whose item uses, hits or relationships changed can gain or lose a trait
+        for name in self.traits_dirty:
+             self.racers[name].check_trait_conditions()
+        self.traits_dirty.clear()
 
         return self.game_over
 
 
     def print_status(self):
-        print(f"\n--- Race Status (Step {self.step_count}) ---")
-        sorted_racers = sorted(self.racers.values(), key=lambda r: r.position, reverse=True)
-        print("Place | Name        | Position | Speed | Item          | Boost | Hit | Traits")
-        print("------|-------------|----------|-------|---------------|-------|-----|---------------")
+        # Build the whole table and write it at once rather than a print() per line
+        lines = [
+            f"\n--- Race Status (Step {self.step_count}) ---",
+            "Place | Name        | Position | Speed | Item          | Boost | Hit | Traits",
+            "------|-------------|----------|-------|---------------|-------|-----|---------------",
+        ]
+        sorted_racers = self.standings
         for i, r in enumerate(sorted_racers):
             pos_str = f"{r.position:.1f}/{self.config['track_length']}"
-            item_str = r.current_item if r.current_item else "None"
+            item_str = ITEM_NAMES[r.current_item]
             boost_str = f"Yes ({r.boost_timer})" if r.boost_timer > 0 else "No"
             hit_str = f"Yes ({r.hit_timer})" if r.hit_timer > 0 else "No"
-            traits_str = ", ".join(r.traits) if r.traits else "None"
-            print(f"{i+1:<5} | {r.name:<11} | {pos_str:<8} | {r.speed:<5.1f} | {item_str:<13} | {boost_str:<5} | {hit_str:<3} | {traits_str}")
+            traits_str = format_traits(r.traits)
+            lines.append(f"{i+1:<5} | {r.name:<11} | {pos_str:<8} | {r.speed:<5.1f} | {item_str:<13} | {boost_str:<5} | {hit_str:<3} | {traits_str}")
 
         # Print Obstacles
         if self.obstacles:
-             print("Obstacles on track:")
+             lines.append("Obstacles on track:")
              for obs in self.obstacles:
-                 print(f"  - {obs['type']} at {obs['position']:.1f} (Owner: {obs['owner']})")
+                 lines.append(f"  - {ITEM_NAMES[obs['type']]} at {obs['position']:.1f} (Owner: {obs['owner']})")
+        lines.append("")
+        sys.stdout.write("\n".join(lines))
 
     def get_racer_details(self, name):
          racer = self.racers.get(name)
@@ -530,17 +618,17 @@ class Game:
          details = f"--- Details for {name} ---\n"
          details += f"Position: {racer.position:.1f}\n"
          details += f"Base Speed: {racer.base_speed:.1f}\n"
-         details += f"Current Item: {racer.current_item}\n"
+         details += f"Current Item: {ITEM_NAMES[racer.current_item]}\n"
          details += f"Boost Timer: {racer.boost_timer}\n"
          details += f"Hit Timer: {racer.hit_timer}\n"
-         details += f"Last Hit By: {racer.last_hit_by} ({racer.last_hit_by_item})\n"
-         details += "Traits: " + (", ".join(racer.traits) if racer.traits else "None") + "\n"
+         details += f"Last Hit By: {racer.last_hit_by} ({ITEM_NAMES[racer.last_hit_by_item]})\n"
+         details += "Traits: " + format_traits(racer.traits) + "\n"
          details += "Item Uses:\n"
-         for item, count in racer.item_uses.items():
-             details += f"  - {item}: {count}\n"
+         for item in _ITEMS:
+             details += f"  - {ITEM_NAMES[item]}: {racer.item_uses[item]}\n"
          details += "Times Hit By Item:\n"
-         for item, count in racer.times_hit_by.items():
-             details += f"  - {item}: {count}\n"
+         for item in _HIT_ITEMS:
+             details += f"  - {ITEM_NAMES[item]}: {racer.times_hit_by[item]}\n"
          details += "Relationships:\n"
          if racer.relationships:
              for other_name, score in sorted(racer.relationships.items(), key=lambda item: item[1]):
@@ -564,227 +652,485 @@ class Game:
 
 
 # --- Debug Terminal & Input Handling ---
-debug_log_buffer = queue.Queue()
+debug_log_buffer = deque() # Only touched by the simulation thread, so no locking needed
+show_debug = True # Toggled by the 'debug' command; messages are dropped while OFF
 stop_event = threading.Event()
 input_queue = queue.Queue()
 
-def debug_log(message):
-    """Adds a message to the debug log buffer."""
-    debug_log_buffer.put(message)
+def debug_log(message, *args):
+    """Adds a message to the debug log buffer; %-style args are only formatted when printed."""
+    if not show_debug:
+        return
+    debug_log_buffer.append((message, args))
 
 def print_debug_output():
     """Prints messages from the debug log buffer."""
-    while not debug_log_buffer.empty():
-        print(f"[DEBUG] {debug_log_buffer.get_nowait()}")
+    lines = []
+    while debug_log_buffer:
+        message, args = debug_log_buffer.popleft()
+        lines.append(f"[DEBUG] {message % args if args else message}\n")
+    sys.stdout.write("".join(lines))
+
+def _stdin_has_input():
+    """True if more input is already waiting on stdin (e.g. the rest of a paste); never blocks."""
+    try:
+        return bool(select.select([sys.stdin], [], [], 0)[0])
+    except (OSError, ValueError): # stdin not selectable (e.g. Windows console): no batching
+        return False
+
+def _read_line():
+    """Reads one line from stdin, raising EOFError at end of input.
+
+    Reads go through the unbuffered raw stream when there is one: a thread blocked there holds no
+    buffer lock, so the process can exit at any time, and select() sees exactly what is left unread.
+    """
+    raw = getattr(getattr(sys.stdin, "buffer", None), "raw", None)
+    if raw is None:
+        return input()
+    data = raw.readline()
+    if not data:
+        raise EOFError
+    return data.decode(sys.stdin.encoding or "utf-8", "replace").rstrip("\r\n")
 
 def input_thread_func():
-    """Thread function to handle user input without blocking."""
+    """Thread function to handle user input without blocking; queues lists of lines."""
     while not stop_event.is_set():
+        batch = []
         try:
-            command = input()
-            input_queue.put(command)
+            batch.append(_read_line()) # Blocks until a line arrives, so no extra sleep is needed
+            # Pasted lines arrive together: hand them to the main loop as one batch
+            while _stdin_has_input():
+                batch.append(_read_line())
         except EOFError: # Handle ctrl+d or end of input stream
-             stop_event.set()
+             if batch:
+                 input_queue.put(batch)
+             input_queue.put(None) # Let the main loop finish the queued commands before stopping
              break
-        time.sleep(0.1) # Prevent busy-waiting
+        input_queue.put(batch)
+
+def _next_queued_batch(timeout):
+    """Waits up to timeout (None: forever) for the input thread; returns lines, [] on timeout, None at end of input."""
+    try:
+        return input_queue.get(timeout=timeout)
+    except queue.Empty:
+        return []
+
+class StdinReader:
+    """Reads stdin on the main thread, waiting on it with select() instead of a blocked input thread."""
+
+    def __init__(self):
+        self.fd = sys.stdin.fileno()
+        self.encoding = sys.stdin.encoding or "utf-8"
+        # A plain select() selector: epoll refuses regular files, e.g. stdin redirected from a script
+        self.selector = selectors.SelectSelector()
+        self.selector.register(self.fd, selectors.EVENT_READ)
+        self.partial = b"" # Start of a line whose newline hasn't arrived yet
+        self.eof = False
+
+    def _read(self):
+        """Reads what is available and returns the complete lines in it."""
+        data = os.read(self.fd, 65536)
+        if not data:
+            self.eof = True
+            if not self.partial:
+                return []
+            data = b"\n" # An unterminated last line still counts
+        *lines, self.partial = (self.partial + data).split(b"\n")
+        return [line.decode(self.encoding, "replace").rstrip("\r") for line in lines]
+
+    def read_batch(self, timeout):
+        """Waits up to timeout (None: forever) for input; returns lines, [] on timeout, None at end of input."""
+        if self.eof:
+            return None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        lines = []
+        while not lines:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self.selector.select(remaining):
+                return []
+            lines = self._read()
+            if self.eof:
+                return lines or None
+        # Pasted lines arrive together: hand them to the main loop as one batch
+        while not self.eof and self.selector.select(0):
+            lines += self._read()
+        return lines
+
+def open_input():
+    """Returns the function the main loop waits on for input batches.
+
+    Where stdin can be select()ed (POSIX) it is read directly; otherwise (e.g. the Windows console)
+    a daemon thread blocks on it and hands lines over through input_queue.
+    """
+    if os.name == "posix":
+        try:
+            return StdinReader().read_batch
+        except (OSError, ValueError): # No usable file descriptor (e.g. replaced sys.stdin)
+            pass
+    threading.Thread(target=input_thread_func, daemon=True).start()
+    return _next_queued_batch
+
+
+# --- Debug Terminal Commands ---
+BANNER_TEXT = """--- Mario Kart Nemesis Simulator ---
+Commands:
+  run          - Run the simulation automatically until the end.
+  pause        - Stop an automatic run (any command is handled immediately, even mid-run).
+  step [n=1] [every k] - Advance n steps, showing status every k steps (default: at the end).
+  status [name]- Show racer status (or all if no name).
+  config [key] [value] - View or set a config value.
+  give [racer] [item] - Give an item (Boost, Green_Shell, Red_Shell, Banana).
+  use [item] [target?] - Player uses item (target optional for shells).
+  rel [r1] [r2] [val] - Set relationship score for r1 towards r2.
+  debug        - Toggle showing debug messages (Default: ON).
+  help         - Show this help message.
+  quit         - Exit the simulator.
+Commands can be shortened to any unique prefix (e.g. 'sta', 'gi', 'ru').
+------------------------------------
+"""
+HELP_TEXT = "Commands: run, pause, step [n] [every k], status [name], config [k] [v], give [r] [i], use [i] [t?], rel [r1] [r2] [v], debug, help, quit (unique prefixes work)\n"
+# Printed when a command gets the wrong number of arguments
+_USAGE = {
+    "config": "Usage: config [key] [value] or config [key] or config\n",
+    "give": "Usage: give [racer_name] [item_name]\n",
+    "rel": "Usage: rel [racer1] [racer2] [value]\n",
+}
+
+def _build_item_tokens():
+    """Maps every token 'give' accepts (lowercase) to its item, built once at import."""
+    tokens = {}
+    # Every substring of the normalised names, e.g. 'sh', 'oost', '_shell'; on a clash (e.g. 'shell')
+    # the item listed first wins, just like a scan over _ITEMS for the first name containing the input
+    for item in _ITEMS:
+        name = _ITEM_NORM[item]
+        for start in range(len(name)):
+            for end in range(start + 1, len(name) + 1):
+                tokens.setdefault(name[start:end], item)
+    # Then the spaceless names and initials (e.g. 'greenshell', 'gs')
+    for item in _ITEMS:
+        words = _ITEM_NORM[item].split("_")
+        for alias in ("".join(words), "".join(w[0] for w in words)):
+            tokens.setdefault(alias, item)
+    return tokens
+
+ITEM_BY_TOKEN = _build_item_tokens()
+
+
+@dataclass
+class ReplState:
+    """Debug terminal state shared by the command handlers (show_debug stays module level for debug_log)."""
+    player_command: str | None = None # Player action queued for the next step
+    player_target_arg: str | None = None
+    auto_step: bool = False
+    batch_pending: bool = False # More commands from the same pasted batch follow this one
+    render_pending: bool = False # Standings to show once the current batch is done
+    # CONFIG values read by the loop/handlers, refreshed by the config handler when set
+    step_delay: float = 0.0
+    player_on: bool = True
+    render_every: int = 1
+    config_text: str | None = None # Cached 'config' listing, None when stale
+
+
+def _cmd_quit(game, parts, state):
+    stop_event.set()
+
+def _cmd_run(game, parts, state):
+    state.auto_step = True
+    print("Running simulation automatically...")
+
+def _cmd_pause(game, parts, state):
+    # Commands are picked up between auto steps without waiting out the delay, so this takes effect at once
+    if state.auto_step:
+        state.auto_step = False
+        print("Simulation paused. Use 'run' or 'step' to continue.")
+    else:
+        print("Simulation is not running.")
+
+def _cmd_step(game, parts, state):
+    num_steps = 1
+    if len(parts) > 1 and parts[1].isdecimal():
+        num_steps = int(parts[1])
+    render_every = max(1, num_steps) # By default only the final standings are shown
+    state.render_pending = False # This batch of steps supersedes any deferred standings
+    if len(parts) > 3 and parts[2] == "every" and parts[3].isdecimal():
+        render_every = max(1, int(parts[3]))
+    # Collect the whole batch's output and write it in one go
+    step_output = io.StringIO()
+    with contextlib.redirect_stdout(step_output):
+        for step_idx in range(1, num_steps + 1):
+             if game.game_over: break
+             game.run_step(state.player_command, state.player_target_arg)
+             state.player_command = None # Consume player command
+             state.player_target_arg = None
+             if step_idx == num_steps and state.batch_pending and not game.game_over:
+                 state.render_pending = True # Final standings are shown once the rest of the batch has run
+             elif step_idx % render_every == 0 or game.game_over:
+                 game.print_status()
+             if show_debug: print_debug_output()
+    sys.stdout.write(step_output.getvalue())
+    state.auto_step = False # Stop auto-stepping after manual steps
+
+def _cmd_status(game, parts, state):
+     if len(parts) > 1:
+         print(game.get_racer_details(parts[1]))
+     else:
+         game.print_status()
+         state.render_pending = False
+
+def _cmd_config(game, parts, state):
+     if len(parts) == 1:
+         if state.config_text is None:
+             state.config_text = ("--- Current Configuration ---\n"
+                                  + "".join(f"{key}: {value}\n" for key, value in CONFIG.items())
+                                  + "---------------------------\n")
+         sys.stdout.write(state.config_text)
+     elif len(parts) == 2:
+          key = parts[1]
+          if key in CONFIG:
+              print(f"{key}: {CONFIG[key]}")
+          else:
+              print(f"Unknown config key: {key}")
+     elif len(parts) == 3:
+         key, value_str = parts[1], parts[2]
+         value_type = CONFIG_TYPES.get(key)
+         if value_type is None:
+             print(f"Unknown config key: {key}")
+             return
+         try:
+             # Convert to the setting's original type
+             new_value = value_type(value_str)
+         except ValueError:
+             print(f"Invalid value type for {key}. Expected {value_type.__name__}.")
+             return
+         old_value = CONFIG[key]
+         CONFIG[key] = new_value
+         if key.startswith("item_chance_") or key == "catch_up_item_boost_mult":
+             try:
+                 game.refresh_item_tables()
+             except ValueError as e:
+                 CONFIG[key] = old_value
+                 print(f"Invalid value for {key}: {e}. Keeping {old_value}.")
+                 return
+         elif key.startswith("nemesis_"):
+             game.traits_dirty.update(game.racers) # Thresholds moved, re-check everyone
+         state.config_text = None
+         print(f"Set {key} = {new_value}")
+         if key == "simulation_step_delay":
+             state.step_delay = new_value
+         elif key == "player_controlled":
+             state.player_on = new_value
+         elif key == "render_every":
+             state.render_every = max(1, new_value)
+         # Re-initialize game if critical config changed? For simplicity, no.
+         # Could add checks for things like num_racers requiring restart.
+     else:
+         sys.stdout.write(_USAGE["config"])
+
+def _cmd_give(game, parts, state):
+     if len(parts) == 3:
+         racer_name, item_name_part = parts[1], parts[2]
+         try:
+             racer = game.racers[racer_name]
+         except KeyError:
+             print(f"Racer '{racer_name}' not found.")
+             return
+         item_to_give = ITEM_BY_TOKEN.get(item_name_part.lower())
+
+         if item_to_give:
+             racer.current_item = item_to_give
+             print(f"Gave {ITEM_NAMES[item_to_give]} to {racer_name}.")
+             debug_log("DEBUG CMD: Gave %s to %s.", ITEM_NAMES[item_to_give], racer_name)
+         else:
+             print(f"Invalid item name: {item_name_part}. Use Boost, Green_Shell, Red_Shell, or Banana.")
+     else:
+         sys.stdout.write(_USAGE["give"])
+
+def _cmd_use(game, parts, state):
+    if not state.player_on:
+         print("Player is not enabled (CONFIG['player_controlled']=False).")
+         return
+    try:
+        player_racer = game.racers[game.player_name]
+    except KeyError:
+         print("Player racer not found!") # Should not happen
+         return
+
+    if not player_racer.current_item:
+         print("Player has no item to use.")
+         return
+
+    item_to_use = player_racer.current_item # Item determined by what player holds
+
+    # Determine target based on item and command args
+    target_name_arg = None
+    if item_to_use in _TARGETED_ITEMS and len(parts) > 1:
+        target_name_arg = parts[1]
+        # Validate target exists? The use_item function does basic validation.
+        if target_name_arg not in game.racer_names:
+             print(f"Target racer '{target_name_arg}' not found. Item may fizzle.")
+             # Allow attempting anyway, maybe add better validation later
+
+    # Set player action for the *next* step
+    state.player_command = "use_item"
+    state.player_target_arg = target_name_arg
+    print(f"Player action set: Use {ITEM_NAMES[item_to_use]}" + (f" targeting {target_name_arg}" if target_name_arg else ""))
+    # Don't advance step here, wait for 'step' or 'run' command
+
+def _cmd_rel(game, parts, state):
+     if len(parts) == 4:
+         r1_name, r2_name, val_str = parts[1], parts[2], parts[3]
+         try:
+             r1, r2 = game.racers[r1_name], game.racers[r2_name]
+         except KeyError as e:
+             print(f"Racer '{e.args[0]}' not found.")
+             return
+         if r1 is r2:
+             print("Cannot set relationship to self.")
+             return
+         # Check the digits up front rather than letting int() raise on bad input
+         digits = val_str[1:] if val_str[0] in "+-" else val_str
+         if not digits.isdecimal():
+             print("Invalid relationship value, must be an integer.")
+             return
+         value = int(val_str)
+         r1.update_relationship(r2_name, value - r1.relationships[r2_name]) # Set absolute value
+         game.traits_dirty.add(r1_name)
+         score = r1.relationships[r2_name]
+         print(f"Set {r1_name}'s relationship towards {r2_name} to {score}.")
+         debug_log("DEBUG CMD: Set relationship %s->%s = %d.", r1_name, r2_name, score)
+     else:
+         sys.stdout.write(_USAGE["rel"])
+
+def _cmd_debug(game, parts, state):
+    global show_debug
+    show_debug = not show_debug
+    print(f"Debug messages {'ON' if show_debug else 'OFF'}")
+
+def _cmd_help(game, parts, state):
+     sys.stdout.write(HELP_TEXT)
+
+
+# Commands that never take arguments; a bare one-word line is looked up here first
+ZERO_ARG_HANDLERS = {
+    "quit": _cmd_quit,
+    "run": _cmd_run,
+    "pause": _cmd_pause,
+    "debug": _cmd_debug,
+    "help": _cmd_help,
+}
+ARG_HANDLERS = {
+    "step": _cmd_step,
+    "status": _cmd_status,
+    "config": _cmd_config,
+    "give": _cmd_give,
+    "use": _cmd_use,
+    "rel": _cmd_rel,
+}
+# Command name -> handler(game, parts, state), built once so dispatch is a single dict lookup
+HANDLERS = {**ZERO_ARG_HANDLERS, **ARG_HANDLERS}
+# Most arguments each command reads; anything past that is left joined in one extra part
+HANDLER_ARGC = {**dict.fromkeys(ZERO_ARG_HANDLERS, 0),
+                "step": 3, "status": 1, "config": 2, "give": 2, "use": 1, "rel": 3}
+assert HANDLER_ARGC.keys() == HANDLERS.keys(), "every command needs a HANDLER_ARGC entry"
+
+def execute_command(game, command_line, state):
+    """Parses one command line and runs its handler."""
+    split = command_line.split(maxsplit=1)
+    if not split:
+        return
+    head, *rest = split
+    rest = rest[0] if rest else ""
+    # Interned so lookups against the (literal, hence interned) handler keys hit on identity
+    cmd = sys.intern(head.casefold())
+    if not rest:
+        handler = ZERO_ARG_HANDLERS.get(cmd)
+        if handler is not None:
+            handler(game, (cmd,), state)
+            return
+    handler, candidates = find_handler(cmd)
+    if handler is not None:
+        # Only split as far as the handler looks, so a surplus still shows up as one extra part
+        handler(game, [cmd, *rest.split(maxsplit=HANDLER_ARGC[candidates[0]])], state)
+    elif candidates:
+        print(f"Ambiguous command: {cmd} ({', '.join(candidates)}).")
+    else:
+        print(f"Unknown command: {cmd}. Type 'help' for list.")
+
+def _build_prefix_index(names):
+    """Buckets command names by their first one and first two characters, like Vim's cmdidxs."""
+    index = {}
+    for name in names:
+        index.setdefault((name[0], ""), []).append(name)
+        index.setdefault((name[0], name[1:2]), []).append(name)
+    return index
+
+PREFIX_INDEX = _build_prefix_index(HANDLERS)
+
+def find_handler(cmd):
+    """Returns (handler, candidates) for a command name or a unique prefix of one; handler is None if unknown or ambiguous."""
+    handler = HANDLERS.get(cmd)
+    if handler is not None:
+        return handler, [cmd]
+    # Only the small bucket sharing cmd's first two characters can match
+    candidates = [name for name in PREFIX_INDEX.get((cmd[0], cmd[1:2]), ()) if name.startswith(cmd)]
+    if len(candidates) == 1:
+        return HANDLERS[candidates[0]], candidates
+    return None, candidates
 
 
 # --- Main Simulation Loop ---
 if __name__ == "__main__":
     game = Game(CONFIG)
-    running_simulation = False
-    auto_step = False
-
-    print("--- Mario Kart Nemesis Simulator ---")
-    print("Commands:")
-    print("  run          - Run the simulation automatically until the end.")
-    print("  step [n=1]   - Advance the simulation by n steps.")
-    print("  status [name]- Show racer status (or all if no name).")
-    print("  config [key] [value] - View or set a config value.")
-    print("  give [racer] [item] - Give an item (Boost, Green_Shell, Red_Shell, Banana).")
-    print("  use [item] [target?] - Player uses item (target optional for shells).")
-    print("  rel [r1] [r2] [val] - Set relationship score for r1 towards r2.")
-    print("  debug        - Toggle showing debug messages (Default: ON).")
-    print("  help         - Show this help message.")
-    print("  quit         - Exit the simulator.")
-    print("------------------------------------")
-
-    show_debug = True
-    player_command = None
-    player_target_arg = None
-
-    # Start input thread
-    inp_thread = threading.Thread(target=input_thread_func, daemon=True)
-    inp_thread.start()
+    state = ReplState(step_delay=CONFIG["simulation_step_delay"], player_on=CONFIG["player_controlled"],
+                      render_every=max(1, CONFIG["render_every"]))
 
+    sys.stdout.write(BANNER_TEXT)
+
+    read_batch = open_input()
+
+    next_step_at = time.monotonic() # When the next auto step is due
     try:
         while not game.game_over and not stop_event.is_set():
-            # Process Input Commands
-            while not input_queue.empty():
-                command_line = input_queue.get_nowait()
-                parts = command_line.split()
-                if not parts: continue
-                cmd = parts[0].lower()
-
-                if cmd == "quit":
-                    stop_event.set()
-                    break
-                elif cmd == "run":
-                    auto_step = True
-                    print("Running simulation automatically...")
-                elif cmd == "step":
-                    num_steps = 1
-                    if len(parts) > 1 and parts[1].isdigit():
-                        num_steps = int(parts[1])
-                    for _ in range(num_steps):
-                         if game.game_over: break
-                         game.run_step(player_command, player_target_arg)
-                         player_command = None # Consume player command
-                         player_target_arg = None
-                         game.print_status()
-                         if show_debug: print_debug_output()
-                    auto_step = False # Stop auto-stepping after manual steps
-                elif cmd == "status":
-                     if len(parts) > 1:
-                         print(game.get_racer_details(parts[1]))
-                     else:
-                         game.print_status()
-                elif cmd == "config":
-                     if len(parts) == 1:
-                         print("--- Current Configuration ---")
-                         for key, value in CONFIG.items():
-                             print(f"{key}: {value}")
-                         print("---------------------------")
-                     elif len(parts) == 2:
-                          key = parts[1]
-                          if key in CONFIG:
-                              print(f"{key}: {CONFIG[key]}")
-                          else:
-                              print(f"Unknown config key: {key}")
-                     elif len(parts) == 3:
-                         key, value_str = parts[1], parts[2]
-                         if key in CONFIG:
-                             try:
-                                 # Attempt to convert to the original type
-                                 original_type = type(CONFIG[key])
-                                 new_value = original_type(value_str)
-                                 CONFIG[key] = new_value
-                                 print(f"Set {key} = {new_value}")
-                                 # Re-initialize game if critical config changed? For simplicity, no.
-                                 # Could add checks for things like num_racers requiring restart.
-                             except ValueError:
-                                 print(f"Invalid value type for {key}. Expected {original_type.__name__}.")
-                         else:
-                             print(f"Unknown config key: {key}")
-                     else:
-                         print("Usage: config [key] [value] or config [key] or config")
-
-                elif cmd == "give":
-                     if len(parts) == 3:
-                         racer_name, item_name_part = parts[1], parts[2]
-                         racer = game.racers.get(racer_name)
-                         # Map input string to Item enum robustly
-                         item_to_give = None
-                         for item_val in [Item.BOOST, Item.GREEN_SHELL, Item.RED_SHELL, Item.BANANA]:
-                              if item_name_part.lower() in item_val.lower().replace(" ", "_"):
-                                   item_to_give = item_val
-                                   break
-
-                         if racer and item_to_give:
-                             racer.current_item = item_to_give
-                             print(f"Gave {item_to_give} to {racer_name}.")
-                             debug_log(f"DEBUG CMD: Gave {item_to_give} to {racer_name}.")
-                         elif not racer:
-                             print(f"Racer '{racer_name}' not found.")
-                         else:
-                             print(f"Invalid item name: {item_name_part}. Use Boost, Green_Shell, Red_Shell, or Banana.")
-                     else:
-                         print("Usage: give [racer_name] [item_name]")
-
-                elif cmd == "use":
-                    if not CONFIG["player_controlled"]:
-                         print("Player is not enabled (CONFIG['player_controlled']=False).")
-                         continue
-                    player_racer = game.racers.get(game.player_name)
-                    if not player_racer:
-                         print("Player racer not found!") # Should not happen
-                         continue
-
-                    if not player_racer.current_item:
-                         print("Player has no item to use.")
-                         continue
-
-                    item_to_use = player_racer.current_item # Item determined by what player holds
-
-                    # Determine target based on item and command args
-                    target_name_arg = None
-                    if item_to_use in [Item.GREEN_SHELL, Item.RED_SHELL] and len(parts) > 1:
-                        target_name_arg = parts[1]
-                        # Validate target exists? The use_item function does basic validation.
-                        if target_name_arg not in game.racers:
-                             print(f"Target racer '{target_name_arg}' not found. Item may fizzle.")
-                             # Allow attempting anyway, maybe add better validation later
-
-                    # Set player action for the *next* step
-                    player_command = "use_item"
-                    player_target_arg = target_name_arg
-                    print(f"Player action set: Use {item_to_use}" + (f" targeting {target_name_arg}" if target_name_arg else ""))
-                    # Don't advance step here, wait for 'step' or 'run' command
-
-                elif cmd == "rel":
-                     if len(parts) == 4:
-                         r1_name, r2_name, val_str = parts[1], parts[2], parts[3]
-                         r1 = game.racers.get(r1_name)
-                         r2 = game.racers.get(r2_name)
-                         if r1 and r2 and r1 != r2:
-                             try:
-                                 value = int(val_str)
-                                 r1.update_relationship(r2_name, value - r1.relationships.get(r2_name, 0)) # Set absolute value
-                                 print(f"Set {r1_name}'s relationship towards {r2_name} to {r1.relationships[r2_name]}.")
-                                 debug_log(f"DEBUG CMD: Set relationship {r1_name}->{r2_name} = {r1.relationships[r2_name]}.")
-                             except ValueError:
-                                 print("Invalid relationship value, must be an integer.")
-                         elif not r1: print(f"Racer '{r1_name}' not found.")
-                         elif not r2: print(f"Racer '{r2_name}' not found.")
-                         else: print("Cannot set relationship to self.")
-                     else:
-                         print("Usage: rel [racer1] [racer2] [value]")
-
-                elif cmd == "debug":
-                    show_debug = not show_debug
-                    print(f"Debug messages {'ON' if show_debug else 'OFF'}")
-                elif cmd == "help":
-                     print("Commands: run, step [n], status [name], config [k] [v], give [r] [i], use [i] [t?], rel [r1] [r2] [v], debug, help, quit")
-                else:
-                    print(f"Unknown command: {cmd}. Type 'help' for list.")
+            # Wait for a command: block while idle, or only until the next auto step is due,
+            # so a keystroke is handled immediately even in the middle of a run
+            timeout = max(0.0, next_step_at - time.monotonic()) if state.auto_step else None
+            batch = read_batch(timeout)
+            if batch is None: # End of input
+                stop_event.set()
+                break
+            if batch:
+                # Run a pasted batch back to back; only its last command shows the standings
+                last = len(batch) - 1
+                for i, command_line in enumerate(batch):
+                    state.batch_pending = i < last
+                    execute_command(game, command_line, state)
+                    if stop_event.is_set(): # 'quit'
+                        break
+                state.batch_pending = False
+                if state.render_pending:
+                    game.print_status()
+                    state.render_pending = False
+                continue # Handle any further queued commands before stepping
 
             # Automatic Simulation Step if 'run' was entered
-            if auto_step and not game.game_over:
-                game_over = game.run_step(player_command, player_target_arg)
-                player_command = None # Consume player command after step
-                player_target_arg = None
-                game.print_status()
+            if state.auto_step and not game.game_over:
+                # Pace steps by start time so printing/simulation time counts towards the delay
+                next_step_at = time.monotonic() + state.step_delay
+                game_over = game.run_step(state.player_command, state.player_target_arg)
+                state.player_command = None # Consume player command after step
+                state.player_target_arg = None
+                if game_over or game.step_count % state.render_every == 0:
+                    game.print_status()
                 if show_debug: print_debug_output()
                 if game_over:
-                    auto_step = False # Stop running automatically when game ends
-                else:
-                    time.sleep(CONFIG["simulation_step_delay"]) # Pause between auto steps
-
-            elif not auto_step:
-                 # If not auto-running, give a prompt indication if waiting for input
-                 # (Handled implicitly by the input() call in the thread)
-                 time.sleep(0.1) # Small sleep to prevent busy-looping when idle
-
+                    state.auto_step = False # Stop running automatically when game ends
 
     except KeyboardInterrupt:
         print("\nSimulation interrupted.")
     finally:
         print("Stopping simulation...")
         stop_event.set()
-        # Wait briefly for input thread to notice stop_event
-        time.sleep(0.2)
-        # No join needed for daemon thread, but good practice if it weren't daemon
-        # inp_thread.join()
+        # No need to wait for the daemon input thread: it holds no locks while blocked on stdin
         print("Simulation finished.")
         if game.winner:
              print(f"Winner: {game.winner}")